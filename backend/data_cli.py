@@ -0,0 +1,475 @@
+"""Command-line tool to inspect and migrate the JSON data files.
+
+All commands stream users.json / notifications.json entry by entry, so
+memory stays bounded by the largest single entry rather than the file size.
+Files are rewritten through a temporary file and an atomic rename, so the
+API never reads a half-written file. If the API modifies the target file
+while an import or compaction runs, the command aborts instead of
+overwriting those changes; re-run it (ideally when the API is quiet).
+
+Examples:
+    python data_cli.py export users --format ndjson -o users.ndjson
+    python data_cli.py export notifications --format csv -o notifications.csv
+    python data_cli.py import users users.ndjson
+    python data_cli.py check
+    python data_cli.py compact --keep-last 50
+"""
+import argparse
+import csv
+import fcntl
+import json
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+DEFAULT_DATA_DIR = ROOT_DIR / 'data'
+
+USER_FIELDS = ["id", "nombre", "usuario", "email", "password", "credits", "is_admin", "created_at"]
+NOTIFICATION_FIELDS = ["usuario", "id", "type", "amount", "reason", "timestamp"]
+
+BCRYPT_HASH_RE = re.compile(r"^\$2[abxy]?\$\d{2}\$[./A-Za-z0-9]{53}$")
+
+# Shared with server.write_json_atomic so a rename here never races one there
+WRITE_LOCK_NAME = '.write.lock'
+
+CHUNK_SIZE = 1 << 16
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789+-.eE"
+
+
+class DataFileError(Exception):
+    pass
+
+
+# Streaming helpers
+def iter_object_items(path, chunk_size=CHUNK_SIZE):
+    """Yield (key, value) pairs of a top-level JSON object without loading it whole."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as fh:
+        buf = ''
+        pos = 0
+        eof = False
+
+        def fill():
+            nonlocal buf, pos, eof
+            # Grow reads with the pending data so huge values stay linear
+            data = fh.read(max(chunk_size, len(buf) - pos))
+            if not data:
+                eof = True
+            buf = buf[pos:] + data
+            pos = 0
+
+        def skip_ws():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        def expect(char):
+            nonlocal pos
+            skip_ws()
+            if pos >= len(buf) or buf[pos] != char:
+                raise DataFileError(f"{path}: expected {char!r} in top-level object")
+            pos += 1
+
+        def decode():
+            nonlocal pos
+            skip_ws()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError as exc:
+                    if eof:
+                        raise DataFileError(f"{path}: {exc}") from None
+                    fill()
+                    continue
+                # A number cut by the buffer edge decodes as a shorter number
+                # ("1." as 1, "1.5e" as 1.5), so only accept one once a
+                # non-number character follows it. Other values end in a
+                # delimiter, or fail to decode when truncated.
+                is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if not eof and is_number and (end == len(buf) or buf[end] in _NUMBER_CHARS):
+                    fill()
+                    continue
+                pos = end
+                return value
+
+        expect('{')
+        skip_ws()
+        if pos < len(buf) and buf[pos] == '}':
+            return
+        while True:
+            key = decode()
+            if not isinstance(key, str):
+                raise DataFileError(f"{path}: object keys must be strings")
+            expect(':')
+            yield key, decode()
+            skip_ws()
+            if pos < len(buf) and buf[pos] == ',':
+                pos += 1
+                continue
+            expect('}')
+            skip_ws()
+            if pos < len(buf):
+                raise DataFileError(f"{path}: unexpected data after top-level object")
+            return
+
+
+class ObjectWriter:
+    """Stream a top-level JSON object to disk in the same layout as json.dumps(indent=2)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.source_stat = self._stat()
+        fd, self.tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+        self.fh = os.fdopen(fd, 'w', encoding='utf-8')
+        self.count = 0
+
+    def write(self, key, value):
+        self.fh.write('{\n  ' if self.count == 0 else ',\n  ')
+        self.fh.write(json.dumps(key))
+        self.fh.write(': ')
+        self.fh.write(json.dumps(value, indent=2).replace('\n', '\n  '))
+        self.count += 1
+
+    def _stat(self):
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size, st.st_mode
+
+    def commit(self):
+        self.fh.write('\n}' if self.count else '{}')
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        self.fh.close()
+        with open(self.path.parent / WRITE_LOCK_NAME, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self._stat() != self.source_stat:
+                os.unlink(self.tmp_path)
+                raise DataFileError(f"{self.path} was modified while running; nothing was written, please re-run")
+            if self.source_stat is not None:
+                # mkstemp creates 0600 files; keep the original file's permissions
+                os.chmod(self.tmp_path, self.source_stat[3] & 0o777)
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.fh.close()
+        os.unlink(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+def open_output(path):
+    if path in (None, '-'):
+        return sys.stdout
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def open_input(path):
+    if path in (None, '-'):
+        return sys.stdin
+    return open(path, encoding='utf-8', newline='')
+
+
+def parse_bool(value):
+    return str(value).strip().lower() in ("1", "true", "yes")
+
+
+def read_records(path, fmt):
+    """Yield (line number, dict record) pairs from an NDJSON or CSV input."""
+    fh = open_input(path)
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(fh)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for lineno, line in enumerate(fh, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as exc:
+                    raise DataFileError(f"{path}:{lineno}: {exc}") from None
+                if not isinstance(record, dict):
+                    raise DataFileError(f"{path}:{lineno}: expected a JSON object")
+                yield lineno, record
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+
+
+def write_records(records, fields, fmt, out):
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(out, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+            count += 1
+    else:
+        for record in records:
+            out.write(json.dumps(record))
+            out.write('\n')
+            count += 1
+    return count
+
+
+def iter_user_records(path, skip):
+    for usuario, user in iter_object_items(path):
+        if not isinstance(user, dict):
+            skip(f"user {usuario!r}: entry is not an object")
+            continue
+        yield user
+
+
+def iter_notification_records(path, skip):
+    for usuario, notifications in iter_object_items(path):
+        if not isinstance(notifications, list):
+            skip(f"notifications {usuario!r}: entry is not a list")
+            continue
+        for index, notification in enumerate(notifications):
+            if not isinstance(notification, dict):
+                skip(f"notifications {usuario!r}: entry {index} is not an object")
+                continue
+            yield {"usuario": usuario, **notification}
+
+
+# Commands
+def cmd_export(args):
+    data_dir = Path(args.data_dir)
+    skipped = 0
+
+    def skip(message):
+        nonlocal skipped
+        skipped += 1
+        print(f"skipped {message}", file=sys.stderr)
+
+    out = open_output(args.output)
+    try:
+        if args.kind == 'users':
+            records = iter_user_records(data_dir / 'users.json', skip)
+            count = write_records(records, USER_FIELDS, args.format, out)
+        else:
+            records = iter_notification_records(data_dir / 'notifications.json', skip)
+            count = write_records(records, NOTIFICATION_FIELDS, args.format, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Exported {count} {args.kind} records, skipped {skipped}", file=sys.stderr)
+    return 1 if skipped else 0
+
+
+def normalize_user(record, where):
+    user = {field: record[field] for field in USER_FIELDS if field in record}
+    missing = [field for field in USER_FIELDS if field not in user]
+    if missing:
+        raise DataFileError(f"{where}: user record is missing {', '.join(missing)}")
+    if not isinstance(user["usuario"], str) or not user["usuario"]:
+        raise DataFileError(f"{where}: usuario must be a non-empty string")
+    try:
+        user["credits"] = int(user["credits"])
+    except (TypeError, ValueError):
+        raise DataFileError(f"{where}: credits is not an integer ({user['credits']!r})") from None
+    if not isinstance(user["is_admin"], bool):
+        user["is_admin"] = parse_bool(user["is_admin"])
+    return user
+
+
+def normalize_notification(record, where):
+    notification = {k: v for k, v in record.items() if k != "usuario"}
+    if "amount" in notification:
+        try:
+            notification["amount"] = int(notification["amount"])
+        except (TypeError, ValueError):
+            raise DataFileError(f"{where}: amount is not an integer ({notification['amount']!r})") from None
+    return notification
+
+
+def cmd_import(args):
+    data_dir = Path(args.data_dir)
+    fmt = args.format or ('csv' if str(args.input).endswith('.csv') else 'ndjson')
+    count = 0
+    if args.kind == 'users':
+        seen = set()
+        with ObjectWriter(data_dir / 'users.json') as writer:
+            for lineno, record in read_records(args.input, fmt):
+                user = normalize_user(record, f"{args.input}:{lineno}")
+                if user["usuario"] in seen:
+                    raise DataFileError(f"Duplicate usuario {user['usuario']!r} in input")
+                seen.add(user["usuario"])
+                writer.write(user["usuario"], user)
+                count += 1
+    else:
+        # Notifications are written grouped per user, so input must be grouped too
+        # (which is what `export notifications` produces).
+        finished = set()
+        current, batch = None, []
+        with ObjectWriter(data_dir / 'notifications.json') as writer:
+            for lineno, record in read_records(args.input, fmt):
+                usuario = record.get("usuario")
+                if not isinstance(usuario, str) or not usuario:
+                    raise DataFileError(f"{args.input}:{lineno}: notification record is missing usuario")
+                if usuario != current:
+                    if current is not None:
+                        writer.write(current, batch)
+                        finished.add(current)
+                    if usuario in finished:
+                        raise DataFileError(f"Notifications for {usuario!r} are not contiguous; sort the input by usuario")
+                    current, batch = usuario, []
+                batch.append(normalize_notification(record, f"{args.input}:{lineno}"))
+                count += 1
+            if current is not None:
+                writer.write(current, batch)
+    print(f"Imported {count} {args.kind} records", file=sys.stderr)
+    return 0
+
+
+def cmd_check(args):
+    data_dir = Path(args.data_dir)
+    issues = 0
+
+    def report(message):
+        nonlocal issues
+        issues += 1
+        print(message)
+
+    emails = {}
+    usuarios = set()
+    users_count = 0
+    for key, user in iter_object_items(data_dir / 'users.json'):
+        users_count += 1
+        usuarios.add(key)
+        if not isinstance(user, dict):
+            report(f"user {key!r}: entry is not an object")
+            continue
+        missing = [field for field in USER_FIELDS if field not in user]
+        if missing:
+            report(f"user {key!r}: missing fields {', '.join(missing)}")
+        if user.get("usuario") != key:
+            report(f"user {key!r}: usuario field is {user.get('usuario')!r}")
+        credits = user.get("credits")
+        if not isinstance(credits, int) or isinstance(credits, bool):
+            report(f"user {key!r}: credits is not an integer ({credits!r})")
+        elif credits < 0:
+            report(f"user {key!r}: negative credits ({credits})")
+        if not BCRYPT_HASH_RE.match(str(user.get("password", ""))):
+            report(f"user {key!r}: password is not a valid bcrypt hash")
+        email = str(user.get("email", "")).strip().lower()
+        if email in emails:
+            report(f"user {key!r}: duplicate email {email!r} (also used by {emails[email]!r})")
+        else:
+            emails[email] = key
+    del emails
+
+    notifications_count = 0
+    for usuario, notifications in iter_object_items(data_dir / 'notifications.json'):
+        if not isinstance(notifications, list):
+            report(f"notifications {usuario!r}: entry is not a list")
+            if usuario not in usuarios:
+                report(f"notifications {usuario!r}: orphaned, user does not exist")
+            continue
+        if usuario not in usuarios:
+            report(f"notifications {usuario!r}: orphaned, user does not exist ({len(notifications)} entries)")
+        ids = set()
+        for notification in notifications:
+            notifications_count += 1
+            notification_id = notification.get("id") if isinstance(notification, dict) else None
+            if notification_id is None:
+                report(f"notifications {usuario!r}: notification without id")
+            elif notification_id in ids:
+                report(f"notifications {usuario!r}: duplicate notification id {notification_id!r}")
+            ids.add(notification_id)
+
+    print(f"Checked {users_count} users and {notifications_count} notifications: {issues} issues", file=sys.stderr)
+    return 1 if issues else 0
+
+
+def cmd_compact(args):
+    data_dir = Path(args.data_dir)
+    usuarios = {key for key, _ in iter_object_items(data_dir / 'users.json')}
+    kept = dropped = 0
+    with ObjectWriter(data_dir / 'notifications.json') as writer:
+        for usuario, notifications in iter_object_items(data_dir / 'notifications.json'):
+            if usuario not in usuarios or not isinstance(notifications, list):
+                dropped += len(notifications) if isinstance(notifications, list) else 1
+                continue
+            ids = set()
+            compacted = []
+            for notification in notifications:
+                if not isinstance(notification, dict) or "id" not in notification or notification["id"] in ids:
+                    dropped += 1
+                    continue
+                ids.add(notification["id"])
+                compacted.append(notification)
+            if args.keep_last is not None and len(compacted) > args.keep_last:
+                dropped += len(compacted) - args.keep_last
+                compacted = compacted[-args.keep_last:] if args.keep_last else []
+            if compacted:
+                writer.write(usuario, compacted)
+                kept += len(compacted)
+    print(f"Compacted notifications: kept {kept}, dropped {dropped}", file=sys.stderr)
+    return 0
+
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or greater, got {number}")
+    return number
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Inspect and migrate LSE Hosting data files")
+    parser.add_argument('--data-dir', default=str(DEFAULT_DATA_DIR), help="Directory holding users.json and notifications.json")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Export users or notifications to NDJSON/CSV")
+    export_parser.add_argument('kind', choices=['users', 'notifications'])
+    export_parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    export_parser.add_argument('-o', '--output', default='-', help="Output file (default: stdout)")
+    export_parser.set_defaults(func=cmd_export)
+
+    import_parser = subparsers.add_parser('import', help="Replace users or notifications from NDJSON/CSV")
+    import_parser.add_argument('kind', choices=['users', 'notifications'])
+    import_parser.add_argument('input', help="Input file ('-' for stdin)")
+    import_parser.add_argument('--format', choices=['ndjson', 'csv'], help="Input format (default: from file extension)")
+    import_parser.set_defaults(func=cmd_import)
+
+    check_parser = subparsers.add_parser('check', help="Check data integrity; exits 1 when issues are found")
+    check_parser.set_defaults(func=cmd_check)
+
+    compact_parser = subparsers.add_parser('compact', help="Drop orphaned, duplicate and old notifications")
+    compact_parser.add_argument('--keep-last', type=non_negative_int, help="Keep only the newest N notifications per user")
+    compact_parser.set_defaults(func=cmd_compact)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (DataFileError, OSError, ValueError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
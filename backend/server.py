@@ -1,15 +1,29 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
 import os
+import sys
+import time
 import logging
+import threading
+import bisect
+import heapq
+import asyncio
+import contextvars
+from collections import Counter
+from contextlib import contextmanager, asynccontextmanager, suppress
 from pathlib import Path
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
 import json
+import fcntl
+import hashlib
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 
@@ -21,17 +35,49 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'lse-hosting-secret-key-change-in-prod
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Requests slower than this are logged with their timing breakdown
+SLOW_REQUEST_THRESHOLD_MS = float(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', '500'))
+
+# Background jobs: users processed per batch, and the longest idle sleep
+SCHEDULER_BATCH_SIZE = int(os.environ.get('SCHEDULER_BATCH_SIZE', '500'))
+SCHEDULER_IDLE_SECONDS = 60
+SCHEDULER_ERROR_BACKOFF_SECONDS = 5
+
+# Admission control: per route class, how many requests run at once, how many may
+# wait for a slot, how long they may wait, and the Retry-After sent when shed.
+ADMISSION_LIMITS = {
+    "hashing": {"concurrency": min(os.cpu_count() or 1, 4), "max_queue": 16, "queue_timeout": 2.0, "retry_after": 2},
+    "writes": {"concurrency": 8, "max_queue": 64, "queue_timeout": 5.0, "retry_after": 1},
+    "reads": {"concurrency": 64, "max_queue": 256, "queue_timeout": 5.0, "retry_after": 1}
+}
+HASHING_ROUTES = {("POST", "/api/auth/login"), ("POST", "/api/auth/register")}
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 # Data files
-DATA_DIR = ROOT_DIR / 'data'
+DATA_DIR = Path(os.environ.get('DATA_DIR', ROOT_DIR / 'data'))
 DATA_DIR.mkdir(exist_ok=True)
 
 USERS_FILE = DATA_DIR / 'users.json'
 CONFIG_FILE = DATA_DIR / 'config.json'
 NOTIFICATIONS_FILE = DATA_DIR / 'notifications.json'
+# Also taken by data_cli.py before it swaps in a rewritten file
+WRITE_LOCK_FILE = DATA_DIR / '.write.lock'
+# One append-only NDJSON event log per user, and per-user rollup files sharded
+# by period (see ROLLUP_SHARD_LENGTH)
+CREDIT_HISTORY_DIR = DATA_DIR / 'credit_history'
+CREDIT_ROLLUPS_DIR = DATA_DIR / 'credit_rollups'
+CREDIT_HISTORY_DIR.mkdir(exist_ok=True)
+CREDIT_ROLLUPS_DIR.mkdir(exist_ok=True)
+JOBS_FILE = DATA_DIR / 'jobs.json'
+
+ROLLUP_GRANULARITIES = ("hour", "day")
+# Rollup shards are named by a bucket prefix: hourly buckets are stored one file
+# per month ("2025-11") and daily buckets one file per year ("2025"), so the
+# file a write rewrites stays small no matter how long the history is.
+ROLLUP_SHARD_LENGTH = {"hour": 7, "day": 4}
 
 # Initialize data files
 if not USERS_FILE.exists():
@@ -60,30 +106,299 @@ if not CONFIG_FILE.exists():
 if not NOTIFICATIONS_FILE.exists():
     NOTIFICATIONS_FILE.write_text(json.dumps({}, indent=2))
 
+if not JOBS_FILE.exists():
+    # "queue" is a heap of [run_at, job_id] pairs for pending and running jobs
+    JOBS_FILE.write_text(json.dumps({"queue": [], "jobs": {}}, indent=2))
+
+# Request timing
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+@contextmanager
+def timed(section: str):
+    """Add the time spent in the block to the current request's timing breakdown."""
+    timings = _request_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[section] = timings.get(section, 0.0) + (time.perf_counter() - start) * 1000
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with timed("serialization"):
+            return super().render(content)
+
+class SamplingProfiler:
+    """Periodically samples every thread's stack and aggregates them as folded stacks.
+
+    The output is the "folded" format understood by flamegraph.pl and speedscope:
+    one line per unique stack, frames separated by ';', followed by the sample count.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = Counter()
+        self.sample_count = 0
+        self.started_at = None
+        self.duration_seconds = None
+        self.interval_ms = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration_seconds: float, interval_ms: float):
+        with self._lock:
+            if self.running:
+                raise RuntimeError("Profiler is already running")
+            self.samples = Counter()
+            self.sample_count = 0
+            self.started_at = datetime.now(timezone.utc).isoformat()
+            self.duration_seconds = duration_seconds
+            self.interval_ms = interval_ms
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        interval = self.interval_ms / 1000
+        deadline = time.monotonic() + self.duration_seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+            self._stop.wait(interval)
+
+    def status(self):
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "duration_seconds": self.duration_seconds,
+            "interval_ms": self.interval_ms,
+            "samples": self.sample_count
+        }
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+profiler = SamplingProfiler()
+
 # Helper functions
+def write_json_atomic(path: Path, data):
+    # Write to a sibling temp file and rename so readers (including data_cli.py)
+    # never observe a half-written file.
+    with timed("storage_write"):
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_text(json.dumps(data, indent=2))
+        with open(WRITE_LOCK_FILE, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            os.replace(tmp_path, path)
+
 def load_users():
-    return json.loads(USERS_FILE.read_text())
+    with timed("user_load"):
+        return json.loads(USERS_FILE.read_text())
 
 def save_users(users):
-    USERS_FILE.write_text(json.dumps(users, indent=2))
+    write_json_atomic(USERS_FILE, users)
 
 def load_config():
     return json.loads(CONFIG_FILE.read_text())
 
 def save_config(config):
-    CONFIG_FILE.write_text(json.dumps(config, indent=2))
+    write_json_atomic(CONFIG_FILE, config)
 
 def load_notifications():
     return json.loads(NOTIFICATIONS_FILE.read_text())
 
 def save_notifications(notifications):
-    NOTIFICATIONS_FILE.write_text(json.dumps(notifications, indent=2))
+    write_json_atomic(NOTIFICATIONS_FILE, notifications)
+
+def load_jobs():
+    return json.loads(JOBS_FILE.read_text())
+
+def save_jobs(jobs):
+    write_json_atomic(JOBS_FILE, jobs)
+
+def user_data_file(directory: Path, usuario: str, suffix: str) -> Path:
+    # Usernames are user-supplied, so files are named by digest rather than by name
+    return directory / f"{hashlib.sha256(usuario.encode()).hexdigest()}{suffix}"
+
+def iter_credit_events(usuario: str):
+    path = user_data_file(CREDIT_HISTORY_DIR, usuario, '.ndjson')
+    if not path.exists():
+        return
+    with path.open(encoding='utf-8') as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+def load_credit_events(usuario: str):
+    return list(iter_credit_events(usuario))
+
+def rollup_bucket(timestamp: datetime, granularity: str) -> str:
+    timestamp = timestamp.astimezone(timezone.utc)
+    if granularity == "day":
+        return timestamp.date().isoformat()
+    return timestamp.replace(minute=0, second=0, microsecond=0).isoformat()
+
+def rollup_shard_file(usuario: str, granularity: str, shard: str) -> Path:
+    return user_data_file(CREDIT_ROLLUPS_DIR, usuario, '') / f"{granularity}-{shard}.json"
+
+def load_rollup_shard(usuario: str, granularity: str, shard: str):
+    path = rollup_shard_file(usuario, granularity, shard)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+def add_to_rollup(buckets, bucket: str, amount: int):
+    """Add `amount` to `bucket`, returning the (possibly re-sorted) bucket dict."""
+    if bucket not in buckets:
+        last = next(reversed(buckets), None)
+        buckets[bucket] = {"credits_added": 0, "credits_removed": 0, "net": 0, "events": 0}
+        # Buckets are kept in key order so queries can bisect them
+        if last is not None and bucket < last:
+            buckets = dict(sorted(buckets.items()))
+    totals = buckets[bucket]
+    if amount >= 0:
+        totals["credits_added"] += amount
+    else:
+        totals["credits_removed"] -= amount
+    totals["net"] += amount
+    totals["events"] += 1
+    return buckets
+
+def fold_into_rollups(usuario: str, events):
+    # Group by shard so each touched shard file is read and written once
+    updates = {}
+    for event in events:
+        timestamp = datetime.fromisoformat(event["timestamp"])
+        for granularity in ROLLUP_GRANULARITIES:
+            bucket = rollup_bucket(timestamp, granularity)
+            shard = (granularity, bucket[:ROLLUP_SHARD_LENGTH[granularity]])
+            updates.setdefault(shard, []).append((bucket, event["amount"]))
+    for (granularity, shard), amounts in updates.items():
+        buckets = load_rollup_shard(usuario, granularity, shard)
+        for bucket, amount in amounts:
+            buckets = add_to_rollup(buckets, bucket, amount)
+        path = rollup_shard_file(usuario, granularity, shard)
+        path.parent.mkdir(exist_ok=True)
+        write_json_atomic(path, buckets)
+
+def credit_event_recorded(usuario: str, event_id: str) -> bool:
+    # Only the tail is read: callers look for an event they may have just written
+    path = user_data_file(CREDIT_HISTORY_DIR, usuario, '.ndjson')
+    if not path.exists():
+        return False
+    with path.open('rb') as fh:
+        fh.seek(max(0, path.stat().st_size - 64 * 1024))
+        return event_id.encode() in fh.read()
+
+def rebuild_credit_rollups(usuario: str):
+    user_dir = user_data_file(CREDIT_ROLLUPS_DIR, usuario, '')
+    if user_dir.exists():
+        for path in user_dir.glob('*.json'):
+            path.unlink()
+    fold_into_rollups(usuario, iter_credit_events(usuario))
+
+def record_credit_changes(changes, timestamp: Optional[datetime] = None, job_id: Optional[str] = None,
+                          rerun_users=()):
+    """Append credit change events and fold them into the hourly/daily rollups.
+
+    `changes` is an iterable of (usuario, type, amount, balance, reason) tuples where
+    `amount` is the signed delta actually applied. Only the files of the users in
+    `changes` are touched: one append to each event log and one rewrite of the
+    current hourly and daily rollup shards.
+
+    With `job_id`, event ids are derived from the job and user. Users in
+    `rerun_users` (a batch re-run after a crash) are checked for an already
+    logged event, and only get their rollups rebuilt if it is there.
+    """
+    timestamp = timestamp or datetime.now(timezone.utc)
+    events_by_user = {}
+    for usuario, change_type, amount, balance, reason in changes:
+        events_by_user.setdefault(usuario, []).append({
+            "id": job_event_id(job_id, usuario) if job_id else str(uuid.uuid4()),
+            "type": change_type,
+            "amount": amount,
+            "balance": balance,
+            "reason": reason,
+            "timestamp": timestamp.isoformat()
+        })
+    for usuario, events in events_by_user.items():
+        if job_id and usuario in rerun_users and credit_event_recorded(usuario, events[0]["id"]):
+            # The rollup write may not have happened before the restart
+            rebuild_credit_rollups(usuario)
+            continue
+        with timed("storage_write"):
+            with user_data_file(CREDIT_HISTORY_DIR, usuario, '.ndjson').open('a', encoding='utf-8') as fh:
+                fh.write("".join(json.dumps(event) + "\n" for event in events))
+        fold_into_rollups(usuario, events)
+
+def query_credit_history(usuario: str, start: Optional[datetime], end: Optional[datetime], granularity: str):
+    if granularity == "raw":
+        # The log is in time order: it is streamed from the start, and reading
+        # stops at the first event past `end`
+        events = []
+        for event in iter_credit_events(usuario):
+            timestamp = datetime.fromisoformat(event["timestamp"])
+            if end is not None and timestamp > end:
+                break
+            if start is None or timestamp >= start:
+                events.append(event)
+        return events
+    user_dir = user_data_file(CREDIT_ROLLUPS_DIR, usuario, '')
+    if not user_dir.exists():
+        return []
+    length = ROLLUP_SHARD_LENGTH[granularity]
+    first = None if start is None else rollup_bucket(start, granularity)
+    last = None if end is None else rollup_bucket(end, granularity)
+    shards = sorted(path.stem.split('-', 1)[1] for path in user_dir.glob(f"{granularity}-*.json"))
+    items = []
+    for shard in shards:
+        if first is not None and shard < first[:length]:
+            continue
+        if last is not None and shard > last[:length]:
+            break
+        buckets = load_rollup_shard(usuario, granularity, shard)
+        keys = list(buckets)
+        lo = 0 if first is None else bisect.bisect_left(keys, first)
+        hi = len(keys) if last is None else bisect.bisect_right(keys, last)
+        items.extend({"bucket": bucket, **buckets[bucket]} for bucket in keys[lo:hi])
+    return items
+
+def normalize_query_datetime(value: Optional[datetime]) -> Optional[datetime]:
+    # Naive query timestamps are interpreted as UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    with timed("bcrypt"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    with timed("bcrypt"):
+        return pwd_context.hash(password)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -94,7 +409,8 @@ def create_access_token(data: dict):
 
 def decode_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with timed("auth_decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
     except JWTError:
         return None
@@ -129,6 +445,266 @@ async def get_admin_user(current_user: dict = Depends(get_current_user)):
         )
     return current_user
 
+# Scheduled jobs
+# Held by handlers that write users, notifications, credit history or jobs, and
+# by the scheduler while a batch runs, so their read-modify-write cycles never
+# interleave.
+storage_lock = asyncio.Lock()
+
+def new_job(job_type: str, amount: int, reason: str, run_at: datetime, **extra):
+    return {
+        "id": str(uuid.uuid4()),
+        "type": job_type,
+        "amount": amount,
+        "reason": reason,
+        "run_at": run_at.astimezone(timezone.utc).isoformat(),
+        "status": "pending",
+        "cutoff": None,
+        "cursor": None,
+        "processed": 0,
+        "total": None,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "started_at": None,
+        "finished_at": None,
+        **extra
+    }
+
+def enqueue_job(jobs, job):
+    jobs["jobs"][job["id"]] = job
+    heapq.heappush(jobs["queue"], [job["run_at"], job["id"]])
+
+def dequeue_job(jobs, job_id):
+    jobs["queue"] = [entry for entry in jobs["queue"] if entry[1] != job_id]
+    heapq.heapify(jobs["queue"])
+
+def is_job_target(user, cutoff: datetime) -> bool:
+    # Only users that existed when the job started are targeted, so a grant and
+    # its expiry always apply to the same set of users. Users whose created_at
+    # cannot be parsed are skipped rather than failing the whole job.
+    try:
+        created_at = normalize_query_datetime(datetime.fromisoformat(user["created_at"]))
+    except (KeyError, TypeError, ValueError):
+        return False
+    return created_at <= cutoff
+
+def job_targets(users, job):
+    cutoff = datetime.fromisoformat(job["cutoff"])
+    until = job.get("until")
+    return sorted(
+        usuario for usuario, user in users.items()
+        if (until is None or usuario <= until) and is_job_target(user, cutoff)
+    )
+
+def job_event_id(job_id: str, usuario: str) -> str:
+    # Deterministic, so notifications and history written by a batch that is
+    # re-run after a restart can be recognised and skipped
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"job:{job_id}:{usuario}"))
+
+def run_job_batch(job_id: str, batch_size: int, targets_cache: dict) -> bool:
+    """Apply the next batch of users for a due job; returns True once the job is done.
+
+    Targets are sorted once per job (cached in `targets_cache`) and the last user
+    handled is persisted as the job cursor, so each batch resumes with a bisect
+    and an interrupted job continues where it stopped after a restart.
+
+    Re-running a batch interrupted by a crash is safe: notifications and history
+    events use ids derived from the job and user and are skipped if present, and
+    the users write, which is the commit point, stamps each credited user with the
+    job id so they are not credited twice.
+    """
+    jobs = load_jobs()
+    job = jobs["jobs"][job_id]
+    if job["status"] not in ("pending", "running"):
+        return True
+    users = load_users()
+    now = datetime.now(timezone.utc)
+    if job["status"] == "pending":
+        job["status"] = "running"
+        job["started_at"] = now.isoformat()
+        job["cutoff"] = job["cutoff"] or job["started_at"]
+        targets_cache.pop(job_id, None)
+    if job_id not in targets_cache:
+        targets_cache[job_id] = job_targets(users, job)
+    targets = targets_cache[job_id]
+    job["total"] = len(targets)
+
+    start = 0 if job["cursor"] is None else bisect.bisect_right(targets, job["cursor"])
+    batch = targets[start:start + batch_size]
+    running = {other_id for other_id, other in jobs["jobs"].items() if other["status"] == "running"}
+
+    changes = []
+    for usuario in batch:
+        user = users[usuario]
+        applied_jobs = [applied for applied in user.get("applied_jobs", []) if applied in running]
+        if job_id in applied_jobs:
+            continue
+        if job["type"] == "grant":
+            amount = job["amount"]
+        else:
+            amount = -min(job["amount"], max(user["credits"], 0))
+        if amount == 0:
+            continue
+        user["credits"] += amount
+        user["applied_jobs"] = applied_jobs + [job_id]
+        changes.append((usuario, "scheduled_grant" if amount > 0 else "credit_expiry", amount, user["credits"], job["reason"]))
+
+    if changes:
+        notifications = load_notifications()
+        # Notifications are written first, so only users that already have this
+        # job's notification can have its history event logged too
+        rerun_users = set()
+        for usuario, change_type, amount, balance, reason in changes:
+            notification_id = job_event_id(job_id, usuario)
+            user_notifications = notifications.setdefault(usuario, [])
+            if any(n.get("id") == notification_id for n in user_notifications):
+                rerun_users.add(usuario)
+                continue
+            user_notifications.append({
+                "id": notification_id,
+                "type": "credit_added" if amount > 0 else "credit_removed",
+                "amount": abs(amount),
+                "reason": reason,
+                "timestamp": now.isoformat()
+            })
+        save_notifications(notifications)
+        record_credit_changes(changes, now, job_id=job_id, rerun_users=rerun_users)
+        save_users(users)
+
+    job["cursor"] = batch[-1] if batch else job["cursor"]
+    job["processed"] = start + len(batch)
+    finished = start + len(batch) >= len(targets)
+    if finished:
+        job["status"] = "done"
+        job["finished_at"] = now.isoformat()
+        dequeue_job(jobs, job_id)
+        targets_cache.pop(job_id, None)
+        if job["type"] == "grant" and job.get("expires_in_seconds"):
+            schedule_expiry(jobs, job, now)
+    save_jobs(jobs)
+    return finished
+
+def fail_job(job_id: str):
+    jobs = load_jobs()
+    job = jobs["jobs"].get(job_id)
+    if job is not None:
+        job["status"] = "failed"
+        job["finished_at"] = datetime.now(timezone.utc).isoformat()
+    dequeue_job(jobs, job_id)
+    save_jobs(jobs)
+
+def schedule_expiry(jobs, grant, now: datetime, until: Optional[str] = None):
+    enqueue_job(jobs, new_job(
+        "expire", grant["amount"], f"Expired: {grant['reason']}",
+        now + timedelta(seconds=grant["expires_in_seconds"]),
+        cutoff=grant["cutoff"], until=until, grant_id=grant["id"]
+    ))
+
+class JobScheduler:
+    """Runs due jobs from the persisted heap, one batch at a time.
+
+    Batches run in the threadpool while holding `storage_lock`, so reads keep
+    being served during a batch and writing handlers simply wait for it.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._task = None
+        self._wakeup = None
+        self._targets = {}
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def forget(self, job_id: str):
+        self._targets.pop(job_id, None)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                delay = await self._run_due_batch()
+            except Exception:
+                # A bad jobs file or a failing write must not end the scheduler
+                logger.exception("Job scheduler iteration failed")
+                delay = SCHEDULER_ERROR_BACKOFF_SECONDS
+            if delay <= 0:
+                continue
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, SCHEDULER_IDLE_SECONDS))
+
+    async def _run_due_batch(self) -> float:
+        """Run one batch of the next job if it is due; returns seconds to wait before the next check."""
+        jobs = load_jobs()
+        if not jobs["queue"]:
+            return SCHEDULER_IDLE_SECONDS
+        run_at, job_id = jobs["queue"][0]
+        delay = (datetime.fromisoformat(run_at) - datetime.now(timezone.utc)).total_seconds()
+        if delay > 0:
+            return delay
+        async with storage_lock:
+            try:
+                await run_in_threadpool(run_job_batch, job_id, self.batch_size, self._targets)
+            except Exception:
+                logger.exception("Scheduled job %s failed", job_id)
+                self._targets.pop(job_id, None)
+                fail_job(job_id)
+        return 0
+
+scheduler = JobScheduler(SCHEDULER_BATCH_SIZE)
+
+# Admission control
+class AdmissionController:
+    """Bounded concurrency with a bounded, deadline-limited wait queue for one route class."""
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, queue_timeout: float, retry_after: int):
+        self.name = name
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.waiting = 0
+
+    async def acquire(self) -> bool:
+        if not self.semaphore.locked():
+            # Take a free slot right away; wait_for would only claim it once its
+            # task runs, letting a burst of requests all skip the queue check.
+            await self.semaphore.acquire()
+            return True
+        if self.waiting >= self.max_queue:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self.semaphore.release()
+
+admission_controllers = {name: AdmissionController(name, **limits) for name, limits in ADMISSION_LIMITS.items()}
+
+def admission_class(request: Request) -> str:
+    if (request.method, request.url.path) in HASHING_ROUTES:
+        return "hashing"
+    if request.method in ("GET", "HEAD", "OPTIONS"):
+        return "reads"
+    return "writes"
+
 # Models
 class RegisterRequest(BaseModel):
     nombre: str
@@ -166,15 +742,33 @@ class UpdateConfigRequest(BaseModel):
 class ClaimCreditsRequest(BaseModel):
     intervals: int
 
+# Stored on user records but never returned by the API
+PRIVATE_USER_FIELDS = ("password", "applied_jobs")
+
+HISTORY_GRANULARITY_PATTERN = "^(raw|hour|day)$"
+
+class ProfilerStartRequest(BaseModel):
+    duration_seconds: float = 30
+    interval_ms: float = 10
+
+class ScheduleGrantRequest(BaseModel):
+    amount: int
+    reason: str
+    run_at: datetime
+    expires_in_seconds: Optional[int] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    scheduler.start()
+    yield
+    await scheduler.stop()
+
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=TimedJSONResponse, lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # Auth endpoints
-@api_router.post("/auth/register", response_model=TokenResponse)
-async def register(data: RegisterRequest):
-    users = load_users()
-    
+def check_registration_available(users, data: RegisterRequest):
     # Check if user already exists
     if data.usuario in users:
         raise HTTPException(
@@ -189,28 +783,40 @@ async def register(data: RegisterRequest):
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
             )
+
+@api_router.post("/auth/register", response_model=TokenResponse)
+async def register(data: RegisterRequest):
+    check_registration_available(load_users(), data)
     
-    # Create new user
-    user_id = str(uuid.uuid4())
-    new_user = {
-        "id": user_id,
-        "nombre": data.nombre,
-        "usuario": data.usuario,
-        "email": data.email,
-        "password": get_password_hash(data.password),
-        "credits": 0,
-        "is_admin": False,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
+    # Hash off the event loop so other requests keep being served
+    password_hash = await run_in_threadpool(get_password_hash, data.password)
+    
+    # Users may have changed while hashing, so check again before saving
+    async with storage_lock:
+        users = load_users()
+        check_registration_available(users, data)
     
-    users[data.usuario] = new_user
-    save_users(users)
+        # Create new user
+        user_id = str(uuid.uuid4())
+        new_user = {
+            "id": user_id,
+            "nombre": data.nombre,
+            "usuario": data.usuario,
+            "email": data.email,
+            "password": password_hash,
+            "credits": 0,
+            "is_admin": False,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+    
+        users[data.usuario] = new_user
+        save_users(users)
     
     # Create token
     access_token = create_access_token(data={"sub": data.usuario})
     
     # Remove password from response
-    user_response = {k: v for k, v in new_user.items() if k != "password"}
+    user_response = {k: v for k, v in new_user.items() if k not in PRIVATE_USER_FIELDS}
     
     return {
         "access_token": access_token,
@@ -230,7 +836,7 @@ async def login(data: LoginRequest):
     
     user = users[data.usuario]
     
-    if not verify_password(data.password, user["password"]):
+    if not await run_in_threadpool(verify_password, data.password, user["password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
@@ -240,7 +846,7 @@ async def login(data: LoginRequest):
     access_token = create_access_token(data={"sub": data.usuario})
     
     # Remove password from response
-    user_response = {k: v for k, v in user.items() if k != "password"}
+    user_response = {k: v for k, v in user.items() if k not in PRIVATE_USER_FIELDS}
     
     return {
         "access_token": access_token,
@@ -250,7 +856,7 @@ async def login(data: LoginRequest):
 
 @api_router.get("/auth/me", response_model=UserResponse)
 async def get_me(current_user: dict = Depends(get_current_user)):
-    return {k: v for k, v in current_user.items() if k != "password"}
+    return {k: v for k, v in current_user.items() if k not in PRIVATE_USER_FIELDS}
 
 # User endpoints
 @api_router.post("/credits/claim")
@@ -258,9 +864,14 @@ async def claim_credits(data: ClaimCreditsRequest, current_user: dict = Depends(
     config = load_config()
     credits_to_add = data.intervals * config["credits_per_interval"]
     
-    users = load_users()
-    users[current_user["usuario"]]["credits"] += credits_to_add
-    save_users(users)
+    async with storage_lock:
+        users = load_users()
+        users[current_user["usuario"]]["credits"] += credits_to_add
+        save_users(users)
+        record_credit_changes([(
+            current_user["usuario"], "claim", credits_to_add, users[current_user["usuario"]]["credits"],
+            f"Claimed {data.intervals} intervals"
+        )])
     
     return {
         "success": True,
@@ -268,6 +879,21 @@ async def claim_credits(data: ClaimCreditsRequest, current_user: dict = Depends(
         "total_credits": users[current_user["usuario"]]["credits"]
     }
 
+@api_router.get("/credits/history")
+async def get_credit_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = Query("raw", pattern=HISTORY_GRANULARITY_PATTERN),
+    current_user: dict = Depends(get_current_user)
+):
+    return {
+        "usuario": current_user["usuario"],
+        "granularity": granularity,
+        "items": query_credit_history(
+            current_user["usuario"], normalize_query_datetime(start), normalize_query_datetime(end), granularity
+        )
+    }
+
 @api_router.get("/notifications")
 async def get_notifications(current_user: dict = Depends(get_current_user)):
     notifications = load_notifications()
@@ -276,10 +902,11 @@ async def get_notifications(current_user: dict = Depends(get_current_user)):
 
 @api_router.delete("/notifications/{notification_id}")
 async def delete_notification(notification_id: str, current_user: dict = Depends(get_current_user)):
-    notifications = load_notifications()
-    user_notifications = notifications.get(current_user["usuario"], [])
-    notifications[current_user["usuario"]] = [n for n in user_notifications if n["id"] != notification_id]
-    save_notifications(notifications)
+    async with storage_lock:
+        notifications = load_notifications()
+        user_notifications = notifications.get(current_user["usuario"], [])
+        notifications[current_user["usuario"]] = [n for n in user_notifications if n["id"] != notification_id]
+        save_notifications(notifications)
     return {"success": True}
 
 @api_router.get("/config")
@@ -290,34 +917,36 @@ async def get_config():
 @api_router.get("/admin/users", response_model=List[UserResponse])
 async def get_all_users(admin: dict = Depends(get_admin_user)):
     users = load_users()
-    return [{k: v for k, v in user.items() if k != "password"} for user in users.values()]
+    return [{k: v for k, v in user.items() if k not in PRIVATE_USER_FIELDS} for user in users.values()]
 
 @api_router.post("/admin/credits/add")
 async def add_credits(data: UpdateCreditsRequest, admin: dict = Depends(get_admin_user)):
-    users = load_users()
+    async with storage_lock:
+        users = load_users()
     
-    if data.usuario not in users:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
+        if data.usuario not in users:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
     
-    users[data.usuario]["credits"] += data.credits
-    save_users(users)
+        users[data.usuario]["credits"] += data.credits
+        save_users(users)
+        record_credit_changes([(data.usuario, "admin_add", data.credits, users[data.usuario]["credits"], data.reason)])
     
-    # Add notification
-    notifications = load_notifications()
-    if data.usuario not in notifications:
-        notifications[data.usuario] = []
+        # Add notification
+        notifications = load_notifications()
+        if data.usuario not in notifications:
+            notifications[data.usuario] = []
     
-    notifications[data.usuario].append({
-        "id": str(uuid.uuid4()),
-        "type": "credit_added",
-        "amount": data.credits,
-        "reason": data.reason,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    })
-    save_notifications(notifications)
+        notifications[data.usuario].append({
+            "id": str(uuid.uuid4()),
+            "type": "credit_added",
+            "amount": data.credits,
+            "reason": data.reason,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        })
+        save_notifications(notifications)
     
     return {
         "success": True,
@@ -326,36 +955,73 @@ async def add_credits(data: UpdateCreditsRequest, admin: dict = Depends(get_admi
 
 @api_router.post("/admin/credits/remove")
 async def remove_credits(data: UpdateCreditsRequest, admin: dict = Depends(get_admin_user)):
-    users = load_users()
+    async with storage_lock:
+        users = load_users()
     
-    if data.usuario not in users:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
+        if data.usuario not in users:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
     
-    users[data.usuario]["credits"] = max(0, users[data.usuario]["credits"] - data.credits)
-    save_users(users)
+        previous_credits = users[data.usuario]["credits"]
+        users[data.usuario]["credits"] = max(0, previous_credits - data.credits)
+        save_users(users)
+        record_credit_changes([(
+            data.usuario, "admin_remove", users[data.usuario]["credits"] - previous_credits,
+            users[data.usuario]["credits"], data.reason
+        )])
     
-    # Add notification
-    notifications = load_notifications()
-    if data.usuario not in notifications:
-        notifications[data.usuario] = []
+        # Add notification
+        notifications = load_notifications()
+        if data.usuario not in notifications:
+            notifications[data.usuario] = []
     
-    notifications[data.usuario].append({
-        "id": str(uuid.uuid4()),
-        "type": "credit_removed",
-        "amount": data.credits,
-        "reason": data.reason,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    })
-    save_notifications(notifications)
+        notifications[data.usuario].append({
+            "id": str(uuid.uuid4()),
+            "type": "credit_removed",
+            "amount": data.credits,
+            "reason": data.reason,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        })
+        save_notifications(notifications)
     
     return {
         "success": True,
         "new_balance": users[data.usuario]["credits"]
     }
 
+@api_router.get("/admin/credits/history")
+async def get_all_credit_history(
+    usuario: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = Query("day", pattern=HISTORY_GRANULARITY_PATTERN),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    admin: dict = Depends(get_admin_user)
+):
+    if granularity == "raw" and usuario is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="usuario is required for raw history"
+        )
+    start = normalize_query_datetime(start)
+    end = normalize_query_datetime(end)
+    # Without usuario, users are paged (in usuario order) by offset/limit
+    usuarios = [usuario] if usuario is not None else sorted(load_users())
+    page = usuarios[offset:offset + limit]
+    items = {}
+    for name in page:
+        user_items = query_credit_history(name, start, end, granularity)
+        if user_items:
+            items[name] = user_items
+    return {
+        "granularity": granularity,
+        "users": items,
+        "next_offset": offset + limit if offset + limit < len(usuarios) else None
+    }
+
 @api_router.post("/admin/config")
 async def update_config(data: UpdateConfigRequest, admin: dict = Depends(get_admin_user)):
     config = {
@@ -365,9 +1031,120 @@ async def update_config(data: UpdateConfigRequest, admin: dict = Depends(get_adm
     save_config(config)
     return {"success": True, "config": config}
 
+@api_router.get("/admin/jobs")
+async def get_jobs(admin: dict = Depends(get_admin_user)):
+    jobs = load_jobs()
+    return sorted(jobs["jobs"].values(), key=lambda job: job["run_at"], reverse=True)
+
+@api_router.post("/admin/jobs")
+async def schedule_grant(data: ScheduleGrantRequest, admin: dict = Depends(get_admin_user)):
+    if data.amount <= 0 or (data.expires_in_seconds is not None and data.expires_in_seconds <= 0):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="amount and expires_in_seconds must be positive"
+        )
+    run_at = normalize_query_datetime(data.run_at)
+    job = new_job("grant", data.amount, data.reason, run_at, expires_in_seconds=data.expires_in_seconds)
+    async with storage_lock:
+        jobs = load_jobs()
+        enqueue_job(jobs, job)
+        save_jobs(jobs)
+    scheduler.wake()
+    return {"success": True, "job": job}
+
+@api_router.delete("/admin/jobs/{job_id}")
+async def cancel_job(job_id: str, admin: dict = Depends(get_admin_user)):
+    async with storage_lock:
+        jobs = load_jobs()
+        job = jobs["jobs"].get(job_id)
+        if job is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Job not found"
+            )
+        if job["status"] not in ("pending", "running"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Job is already {job['status']}"
+            )
+        now = datetime.now(timezone.utc)
+        if job["type"] == "grant" and job["status"] == "running" and job.get("expires_in_seconds") and job["cursor"]:
+            # Users up to the cursor already got the credits, so they still expire
+            schedule_expiry(jobs, job, now, until=job["cursor"])
+        job["status"] = "cancelled"
+        job["finished_at"] = now.isoformat()
+        dequeue_job(jobs, job_id)
+        save_jobs(jobs)
+    scheduler.forget(job_id)
+    scheduler.wake()
+    return {"success": True, "job": job}
+
+@api_router.get("/admin/profiler")
+async def get_profiler_status(admin: dict = Depends(get_admin_user)):
+    return profiler.status()
+
+@api_router.post("/admin/profiler/start")
+async def start_profiler(data: ProfilerStartRequest, admin: dict = Depends(get_admin_user)):
+    if not 0 < data.duration_seconds <= 300 or not 1 <= data.interval_ms <= 1000:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="duration_seconds must be in (0, 300] and interval_ms in [1, 1000]"
+        )
+    try:
+        profiler.start(data.duration_seconds, data.interval_ms)
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    return {"success": True, "profiler": profiler.status()}
+
+@api_router.post("/admin/profiler/stop")
+async def stop_profiler(admin: dict = Depends(get_admin_user)):
+    await run_in_threadpool(profiler.stop)
+    return {"success": True, "profiler": profiler.status()}
+
+@api_router.get("/admin/profiler/profile", response_class=PlainTextResponse)
+async def get_profile(admin: dict = Depends(get_admin_user)):
+    return profiler.folded()
+
 # Include router
 app.include_router(api_router)
 
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    controller = admission_controllers[admission_class(request)]
+    with timed("admission_wait"):
+        admitted = await controller.acquire()
+    if not admitted:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Server is busy, please retry later"},
+            headers={"Retry-After": str(controller.retry_after)}
+        )
+    try:
+        return await call_next(request)
+    finally:
+        controller.release()
+
+@app.middleware("http")
+async def log_slow_requests(request: Request, call_next):
+    timings = {}
+    token = _request_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _request_timings.reset(token)
+    total_ms = (time.perf_counter() - start) * 1000
+    if total_ms >= SLOW_REQUEST_THRESHOLD_MS:
+        breakdown = ", ".join(f"{section}={ms:.1f}ms" for section, ms in sorted(timings.items(), key=lambda item: -item[1]))
+        logger.warning(
+            "Slow request %s %s -> %s in %.1fms (%s)",
+            request.method, request.url.path, response.status_code, total_ms, breakdown or "no breakdown"
+        )
+    return response
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The backend is a flat directory of modules rather than an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+# Keep server imports from creating or modifying files in backend/data
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='lse-test-data-'))
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+import server
+
+
+@pytest.fixture
+def slow_bcrypt(monkeypatch):
+    def verify_password(plain_password, hashed_password, delay=0.3):
+        time.sleep(delay)
+        return True
+
+    monkeypatch.setattr(server, "verify_password", verify_password)
+    return verify_password
+
+
+def use_limits(monkeypatch, name, **limits):
+    monkeypatch.setitem(server.admission_controllers, name, server.AdmissionController(name, **limits))
+
+
+async def timed_request(client, method, url, **kwargs):
+    start = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    return response, time.perf_counter() - start
+
+
+async def storm(logins, reads=0, read_delay=0.05):
+    async with AsyncClient(transport=ASGITransport(app=server.app), base_url="http://test") as client:
+        async def login():
+            return await timed_request(client, "POST", "/api/auth/login", json={"usuario": "admin", "password": "x"})
+
+        async def read():
+            await asyncio.sleep(read_delay)
+            return await timed_request(client, "GET", "/api/config")
+
+        results = await asyncio.gather(*[login() for _ in range(logins)], *[read() for _ in range(reads)])
+    return results[:logins], results[logins:]
+
+
+def test_sheds_when_queue_is_full(monkeypatch, slow_bcrypt):
+    use_limits(monkeypatch, "hashing", concurrency=1, max_queue=1, queue_timeout=5.0, retry_after=2)
+    logins, _ = asyncio.run(storm(6))
+    admitted = [elapsed for response, elapsed in logins if response.status_code == 200]
+    shed = [(response, elapsed) for response, elapsed in logins if response.status_code == 503]
+    assert len(admitted) == 2
+    assert len(shed) == 4
+    for response, elapsed in shed:
+        assert response.headers["Retry-After"] == "2"
+        assert elapsed < 0.2
+
+
+def test_sheds_after_queue_deadline(monkeypatch, slow_bcrypt):
+    use_limits(monkeypatch, "hashing", concurrency=1, max_queue=10, queue_timeout=0.1, retry_after=3)
+    logins, _ = asyncio.run(storm(3))
+    statuses = sorted(response.status_code for response, _ in logins)
+    assert statuses == [200, 503, 503]
+    for response, elapsed in logins:
+        if response.status_code == 503:
+            assert response.headers["Retry-After"] == "3"
+            assert 0.1 <= elapsed < 0.3
+
+
+def test_reads_stay_available_during_login_storm(monkeypatch, slow_bcrypt):
+    use_limits(monkeypatch, "hashing", concurrency=1, max_queue=2, queue_timeout=5.0, retry_after=2)
+    logins, reads = asyncio.run(storm(20, reads=5))
+    assert sum(response.status_code == 503 for response, _ in logins) == 17
+    for response, elapsed in reads:
+        assert response.status_code == 200
+        assert elapsed < 0.2
+
+
+def test_route_classes():
+    def request(method, path):
+        return server.Request({"type": "http", "method": method, "path": path, "headers": [], "query_string": b""})
+
+    assert server.admission_class(request("POST", "/api/auth/login")) == "hashing"
+    assert server.admission_class(request("POST", "/api/auth/register")) == "hashing"
+    assert server.admission_class(request("POST", "/api/credits/claim")) == "writes"
+    assert server.admission_class(request("DELETE", "/api/notifications/1")) == "writes"
+    assert server.admission_class(request("GET", "/api/auth/me")) == "reads"
@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def history_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "CREDIT_HISTORY_DIR", tmp_path / 'credit_history')
+    monkeypatch.setattr(server, "CREDIT_ROLLUPS_DIR", tmp_path / 'credit_rollups')
+    server.CREDIT_HISTORY_DIR.mkdir()
+    server.CREDIT_ROLLUPS_DIR.mkdir()
+    yield
+    server.app.dependency_overrides.clear()
+
+
+def at(hour, day=1):
+    return datetime(2025, 11, day, hour, 30, tzinfo=timezone.utc)
+
+
+def test_changes_only_touch_the_users_involved():
+    server.record_credit_changes([("alice", "claim", 5, 5, "r")], at(9))
+    server.record_credit_changes([("bob", "admin_add", 3, 3, "r")], at(9))
+    assert len(list(server.CREDIT_HISTORY_DIR.iterdir())) == 2
+    assert [e["amount"] for e in server.load_credit_events("alice")] == [5]
+    assert [e["amount"] for e in server.load_credit_events("bob")] == [3]
+
+
+def test_user_files_do_not_use_raw_names():
+    server.record_credit_changes([("../evil", "claim", 1, 1, "r")], at(9))
+    assert all(path.parent == server.CREDIT_HISTORY_DIR for path in server.CREDIT_HISTORY_DIR.iterdir())
+    assert server.load_credit_events("../evil")[0]["amount"] == 1
+
+
+def test_rollups_aggregate_per_bucket():
+    server.record_credit_changes([("alice", "claim", 5, 5, "r")], at(9))
+    server.record_credit_changes([("alice", "admin_remove", -2, 3, "r")], at(9))
+    server.record_credit_changes([("alice", "claim", 4, 7, "r")], at(11))
+    hours = server.query_credit_history("alice", None, None, "hour")
+    assert hours == [
+        {"bucket": "2025-11-01T09:00:00+00:00", "credits_added": 5, "credits_removed": 2, "net": 3, "events": 2},
+        {"bucket": "2025-11-01T11:00:00+00:00", "credits_added": 4, "credits_removed": 0, "net": 4, "events": 1}
+    ]
+    days = server.query_credit_history("alice", None, None, "day")
+    assert days == [{"bucket": "2025-11-01", "credits_added": 9, "credits_removed": 2, "net": 7, "events": 3}]
+
+
+def test_out_of_order_buckets_stay_sorted():
+    for hour in (12, 9, 15, 10):
+        server.record_credit_changes([("alice", "claim", hour, hour, "r")], at(hour))
+    buckets = [item["bucket"] for item in server.query_credit_history("alice", None, None, "hour")]
+    assert buckets == sorted(buckets)
+
+
+def test_range_queries():
+    for day in (1, 2, 3):
+        server.record_credit_changes([("alice", "claim", day, day, "r")], at(9, day))
+    days = server.query_credit_history("alice", at(0, 2), at(23, 3), "day")
+    assert [item["bucket"] for item in days] == ["2025-11-02", "2025-11-03"]
+    events = server.query_credit_history("alice", at(0, 2), at(12, 2), "raw")
+    assert [event["amount"] for event in events] == [2]
+    assert server.query_credit_history("nobody", None, None, "raw") == []
+    assert server.query_credit_history("nobody", None, None, "hour") == []
+
+
+def test_rollups_are_sharded_by_period():
+    server.record_credit_changes([("alice", "claim", 1, 1, "r")], datetime(2025, 11, 30, 23, 30, tzinfo=timezone.utc))
+    server.record_credit_changes([("alice", "claim", 2, 3, "r")], datetime(2025, 12, 1, 0, 30, tzinfo=timezone.utc))
+    server.record_credit_changes([("alice", "claim", 4, 7, "r")], datetime(2026, 1, 1, 0, 30, tzinfo=timezone.utc))
+    [user_dir] = server.CREDIT_ROLLUPS_DIR.iterdir()
+    assert sorted(path.name for path in user_dir.iterdir()) == [
+        "day-2025.json", "day-2026.json", "hour-2025-11.json", "hour-2025-12.json", "hour-2026-01.json"
+    ]
+    hours = server.query_credit_history(
+        "alice",
+        datetime(2025, 11, 30, 23, tzinfo=timezone.utc),
+        datetime(2025, 12, 31, tzinfo=timezone.utc),
+        "hour"
+    )
+    assert [(item["bucket"], item["net"]) for item in hours] == [
+        ("2025-11-30T23:00:00+00:00", 1), ("2025-12-01T00:00:00+00:00", 2)
+    ]
+    days = server.query_credit_history("alice", datetime(2025, 12, 1, tzinfo=timezone.utc), None, "day")
+    assert [item["bucket"] for item in days] == ["2025-12-01", "2026-01-01"]
+
+
+def test_rebuild_matches_incremental_rollups():
+    for day in (1, 2):
+        server.record_credit_changes([("alice", "claim", day, day, "r")], at(9, day))
+    before = server.query_credit_history("alice", None, None, "hour")
+    server.rebuild_credit_rollups("alice")
+    assert server.query_credit_history("alice", None, None, "hour") == before
+
+
+def admin_history(params, monkeypatch, usuarios):
+    monkeypatch.setattr(server, "load_users", lambda: {name: {} for name in usuarios})
+    server.app.dependency_overrides[server.get_current_user] = lambda: {"usuario": "admin", "is_admin": True}
+
+    async def run():
+        async with AsyncClient(transport=ASGITransport(app=server.app), base_url="http://test") as client:
+            return await client.get("/api/admin/credits/history", params=params)
+
+    return asyncio.run(run())
+
+
+def test_admin_raw_history_requires_usuario(monkeypatch):
+    server.record_credit_changes([("alice", "claim", 5, 5, "r")], at(9))
+    response = admin_history({"granularity": "raw"}, monkeypatch, ["alice"])
+    assert response.status_code == 400
+    response = admin_history({"granularity": "raw", "usuario": "alice"}, monkeypatch, ["alice"])
+    assert response.status_code == 200
+    assert [event["amount"] for event in response.json()["users"]["alice"]] == [5]
+
+
+def test_admin_history_pages_over_users(monkeypatch):
+    usuarios = ["alice", "bob", "carol"]
+    for usuario in usuarios:
+        server.record_credit_changes([(usuario, "claim", 1, 1, "r")], at(9))
+    first = admin_history({"limit": 2}, monkeypatch, usuarios).json()
+    assert sorted(first["users"]) == ["alice", "bob"]
+    assert first["next_offset"] == 2
+    second = admin_history({"limit": 2, "offset": 2}, monkeypatch, usuarios).json()
+    assert sorted(second["users"]) == ["carol"]
+    assert second["next_offset"] is None
@@ -0,0 +1,218 @@
+import json
+
+import pytest
+
+import data_cli
+
+HASH = "$2b$12$AkqPh6KXUR98e6Fek0C/lO6dKKhbj75/9Jl04ChYdkMPjhOfXU4LO"
+
+
+def make_user(usuario, **overrides):
+    user = {
+        "id": f"id-{usuario}",
+        "nombre": usuario.title(),
+        "usuario": usuario,
+        "email": f"{usuario}@example.com",
+        "password": HASH,
+        "credits": 10,
+        "is_admin": False,
+        "created_at": "2025-11-01T09:29:52.400794+00:00"
+    }
+    user.update(overrides)
+    return user
+
+
+def make_notification(notification_id, amount=5):
+    return {
+        "id": notification_id,
+        "type": "credit_added",
+        "amount": amount,
+        "reason": "Test, with \"quotes\"",
+        "timestamp": "2025-11-01T09:31:50.104322+00:00"
+    }
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    users = {name: make_user(name) for name in ("admin", "alice", "bob")}
+    notifications = {
+        "alice": [make_notification("n1"), make_notification("n2", 7)],
+        "bob": [make_notification("n3")]
+    }
+    (tmp_path / 'users.json').write_text(json.dumps(users, indent=2))
+    (tmp_path / 'notifications.json').write_text(json.dumps(notifications, indent=2))
+    return tmp_path
+
+
+def run(data_dir, *args):
+    return data_cli.main(['--data-dir', str(data_dir), *args])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+def test_iter_object_items_with_tiny_chunks(tmp_path, chunk_size):
+    data = {
+        "numbers": [12345678901234567890, -1.5e10, 0],
+        "nested": {"a": [{"b": None}], "s": "x" * 100},
+        "unicode ñ": "café \\\" }",
+        "empty": {}
+    }
+    path = tmp_path / 'data.json'
+    path.write_text(json.dumps(data, indent=2))
+    assert dict(data_cli.iter_object_items(path, chunk_size=chunk_size)) == data
+
+
+@pytest.mark.parametrize("content", ["{}", "  {\n}\n", "{ }"])
+def test_iter_object_items_empty_object(tmp_path, content):
+    path = tmp_path / 'data.json'
+    path.write_text(content)
+    assert list(data_cli.iter_object_items(path, chunk_size=1)) == []
+
+
+@pytest.mark.parametrize("content", ['{"a": 1} garbage', '{"a": 1', '[1, 2]', '{"a" 1}', '{1: 2}'])
+def test_iter_object_items_rejects_malformed(tmp_path, content):
+    path = tmp_path / 'data.json'
+    path.write_text(content)
+    with pytest.raises(data_cli.DataFileError):
+        list(data_cli.iter_object_items(path, chunk_size=2))
+
+
+def test_object_writer_matches_json_dumps(tmp_path):
+    data = {"alice": [make_notification("n1")], "bob": {"x": [1, 2]}}
+    path = tmp_path / 'out.json'
+    with data_cli.ObjectWriter(path) as writer:
+        for key, value in data.items():
+            writer.write(key, value)
+    assert path.read_text() == json.dumps(data, indent=2)
+
+    with data_cli.ObjectWriter(path):
+        pass
+    assert path.read_text() == json.dumps({}, indent=2)
+
+
+def test_object_writer_aborts_when_target_changes(tmp_path):
+    path = tmp_path / 'out.json'
+    path.write_text('{}')
+    writer = data_cli.ObjectWriter(path)
+    writer.write("a", 1)
+    path.with_name('other.json').write_text('{"api": "write"}')
+    path.with_name('other.json').replace(path)
+    with pytest.raises(data_cli.DataFileError):
+        writer.commit()
+    assert json.loads(path.read_text()) == {"api": "write"}
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == '.tmp'] == []
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+@pytest.mark.parametrize("kind, filename", [("users", "users.json"), ("notifications", "notifications.json")])
+def test_export_import_round_trip(data_dir, fmt, kind, filename):
+    original = (data_dir / filename).read_text()
+    exported = data_dir / f"export.{fmt}"
+    assert run(data_dir, 'export', kind, '--format', fmt, '-o', str(exported)) == 0
+    (data_dir / filename).write_text('{}')
+    assert run(data_dir, 'import', kind, str(exported)) == 0
+    assert (data_dir / filename).read_text() == original
+
+
+def test_import_notifications_requires_grouped_input(data_dir):
+    path = data_dir / 'input.ndjson'
+    records = [{"usuario": "alice", **make_notification("n1")}, {"usuario": "bob", **make_notification("n2")},
+               {"usuario": "alice", **make_notification("n3")}]
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    original = (data_dir / 'notifications.json').read_text()
+    assert run(data_dir, 'import', 'notifications', str(path)) == 2
+    assert (data_dir / 'notifications.json').read_text() == original
+
+
+def test_check_clean_data(data_dir, capsys):
+    assert run(data_dir, 'check') == 0
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "0 issues" in captured.err
+
+
+def test_check_reports_malformed_data(data_dir, capsys):
+    users = {
+        "alice": make_user("alice", credits=-3, password="plain"),
+        "bob": make_user("carol", email="ALICE@example.com")
+    }
+    notifications = {
+        "alice": [make_notification("n1"), make_notification("n1")],
+        "ghost": 5
+    }
+    (data_dir / 'users.json').write_text(json.dumps(users))
+    (data_dir / 'notifications.json').write_text(json.dumps(notifications))
+    assert run(data_dir, 'check') == 1
+    out = capsys.readouterr().out.splitlines()
+    assert "user 'alice': negative credits (-3)" in out
+    assert "user 'alice': password is not a valid bcrypt hash" in out
+    assert "user 'bob': usuario field is 'carol'" in out
+    assert "user 'bob': duplicate email 'alice@example.com' (also used by 'alice')" in out
+    assert "notifications 'alice': duplicate notification id 'n1'" in out
+    assert "notifications 'ghost': entry is not a list" in out
+    assert "notifications 'ghost': orphaned, user does not exist" in out
+    assert len(out) == 7
+
+
+def test_check_unreadable_file_exits_2(data_dir, capsys):
+    (data_dir / 'users.json').write_text('{"alice": ')
+    assert run(data_dir, 'check') == 2
+    assert "error:" in capsys.readouterr().err
+
+
+def test_compact_keep_last_drops_orphans_and_duplicates(data_dir):
+    notifications = {
+        "alice": [make_notification("n1"), make_notification("n2"), make_notification("n2"), make_notification("n3")],
+        "bob": [],
+        "ghost": [make_notification("n4")]
+    }
+    (data_dir / 'notifications.json').write_text(json.dumps(notifications))
+    assert run(data_dir, 'compact', '--keep-last', '2') == 0
+    compacted = json.loads((data_dir / 'notifications.json').read_text())
+    assert compacted == {"alice": [make_notification("n2"), make_notification("n3")]}
+
+
+def test_iter_object_items_numbers_at_every_chunk_boundary(tmp_path):
+    # Shift top-level floats and exponents across every chunk boundary
+    for padding in range(12):
+        data = {"k" * (padding + 1): 1.5, "b": 2e5, "c": -3.25E-2, "d": 10, "e": 0.5e+3}
+        path = tmp_path / 'data.json'
+        path.write_text(json.dumps(data))
+        for chunk_size in range(1, 48):
+            assert dict(data_cli.iter_object_items(path, chunk_size=chunk_size)) == data
+
+
+def test_export_skips_and_reports_malformed_entries(data_dir, capsys):
+    (data_dir / 'users.json').write_text(json.dumps({"alice": make_user("alice"), "bad": 5}))
+    (data_dir / 'notifications.json').write_text(json.dumps({"a": 5, "alice": [make_notification("n1"), "x"]}))
+    out = data_dir / 'out.ndjson'
+    assert run(data_dir, 'export', 'users', '-o', str(out)) == 1
+    assert [json.loads(line)["usuario"] for line in out.read_text().splitlines()] == ["alice"]
+    assert "skipped user 'bad': entry is not an object" in capsys.readouterr().err
+    assert run(data_dir, 'export', 'notifications', '-o', str(out)) == 1
+    assert [json.loads(line)["id"] for line in out.read_text().splitlines()] == ["n1"]
+    err = capsys.readouterr().err
+    assert "skipped notifications 'a': entry is not a list" in err
+    assert "skipped notifications 'alice': entry 1 is not an object" in err
+
+
+@pytest.mark.parametrize("kind, line", [
+    ("users", "5"),
+    ("users", json.dumps(make_user("alice", credits={}))),
+    ("notifications", '"x"'),
+    ("notifications", json.dumps({"usuario": 5, "id": "n1"})),
+    ("notifications", json.dumps({"usuario": "alice", "id": "n1", "amount": [1]}))
+])
+def test_import_rejects_malformed_records(data_dir, capsys, kind, line):
+    path = data_dir / 'input.ndjson'
+    path.write_text(json.dumps(make_user("bob")) + "\n" + line + "\n" if kind == "users" else line + "\n")
+    original = (data_dir / f"{kind}.json").read_text()
+    assert run(data_dir, 'import', kind, str(path)) == 2
+    assert f"{path}:" in capsys.readouterr().err
+    assert (data_dir / f"{kind}.json").read_text() == original
+
+
+def test_compact_rejects_negative_keep_last(data_dir):
+    original = (data_dir / 'notifications.json').read_text()
+    with pytest.raises(SystemExit):
+        run(data_dir, 'compact', '--keep-last', '-1')
+    assert (data_dir / 'notifications.json').read_text() == original
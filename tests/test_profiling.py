@@ -0,0 +1,93 @@
+import asyncio
+import logging
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+import server
+
+ADMIN = {"usuario": "admin", "is_admin": True}
+
+
+@pytest.fixture(autouse=True)
+def stop_profiler():
+    yield
+    server.profiler.stop()
+    server.app.dependency_overrides.clear()
+
+
+def call(requests, user=None):
+    async def run():
+        if user is not None:
+            server.app.dependency_overrides[server.get_current_user] = lambda: user
+        async with AsyncClient(transport=ASGITransport(app=server.app), base_url="http://test") as client:
+            responses = []
+            for method, url, kwargs in requests:
+                responses.append(await client.request(method, url, **kwargs))
+                await asyncio.sleep(0.05)
+            return responses
+
+    return asyncio.run(run())
+
+
+def test_slow_request_log_has_timing_breakdown(monkeypatch, caplog):
+    monkeypatch.setattr(server, "SLOW_REQUEST_THRESHOLD_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="server"):
+        [response] = call([("POST", "/api/auth/login", {"json": {"usuario": "admin", "password": "admin123"}})])
+    assert response.status_code == 200
+    [record] = [r for r in caplog.records if "Slow request POST /api/auth/login" in r.getMessage()]
+    message = record.getMessage()
+    for section in ("bcrypt=", "user_load=", "serialization="):
+        assert section in message
+
+
+def test_fast_requests_are_not_logged(monkeypatch, caplog):
+    monkeypatch.setattr(server, "SLOW_REQUEST_THRESHOLD_MS", 60_000)
+    with caplog.at_level(logging.WARNING, logger="server"):
+        call([("GET", "/api/config", {})])
+    assert not [r for r in caplog.records if "Slow request" in r.getMessage()]
+
+
+def test_profiler_start_stop_and_profile():
+    start = ("POST", "/api/admin/profiler/start", {"json": {"duration_seconds": 5, "interval_ms": 1}})
+    started, conflict, stopped, profile = call([
+        start,
+        start,
+        ("POST", "/api/admin/profiler/stop", {}),
+        ("GET", "/api/admin/profiler/profile", {})
+    ], user=ADMIN)
+    assert started.status_code == 200
+    assert started.json()["profiler"]["running"] is True
+    assert conflict.status_code == 409
+    assert stopped.status_code == 200
+    assert stopped.json()["profiler"]["running"] is False
+    assert profile.headers["content-type"].startswith("text/plain")
+    lines = profile.text.splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert ";" in stack
+        assert int(count) > 0
+
+
+@pytest.mark.parametrize("body", [
+    {"duration_seconds": 0},
+    {"duration_seconds": 301},
+    {"duration_seconds": 5, "interval_ms": 0.5},
+    {"duration_seconds": 5, "interval_ms": 1001}
+])
+def test_profiler_rejects_out_of_range_settings(body):
+    [response] = call([("POST", "/api/admin/profiler/start", {"json": body})], user=ADMIN)
+    assert response.status_code == 400
+    assert server.profiler.running is False
+
+
+@pytest.mark.parametrize("method, url", [
+    ("GET", "/api/admin/profiler"),
+    ("POST", "/api/admin/profiler/start"),
+    ("POST", "/api/admin/profiler/stop"),
+    ("GET", "/api/admin/profiler/profile")
+])
+def test_profiler_requires_admin(method, url):
+    [response] = call([(method, url, {"json": {}})], user={"usuario": "someone", "is_admin": False})
+    assert response.status_code == 403
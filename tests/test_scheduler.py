@@ -0,0 +1,203 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+import server
+
+CREATED = "2025-11-01T09:00:00+00:00"
+
+
+@pytest.fixture(autouse=True)
+def data_files(tmp_path, monkeypatch):
+    for name, filename in (("USERS_FILE", "users.json"), ("NOTIFICATIONS_FILE", "notifications.json"),
+                           ("JOBS_FILE", "jobs.json")):
+        monkeypatch.setattr(server, name, tmp_path / filename)
+    monkeypatch.setattr(server, "CREDIT_HISTORY_DIR", tmp_path / 'credit_history')
+    monkeypatch.setattr(server, "CREDIT_ROLLUPS_DIR", tmp_path / 'credit_rollups')
+    server.CREDIT_HISTORY_DIR.mkdir()
+    server.CREDIT_ROLLUPS_DIR.mkdir()
+    users = {f"user{i}": {"usuario": f"user{i}", "credits": 10, "created_at": CREATED} for i in range(5)}
+    server.USERS_FILE.write_text(json.dumps(users))
+    server.NOTIFICATIONS_FILE.write_text("{}")
+    server.JOBS_FILE.write_text(json.dumps({"queue": [], "jobs": {}}))
+
+
+def schedule(amount=50, expires_in_seconds=None):
+    job = server.new_job("grant", amount, "Promo", datetime.now(timezone.utc),
+                         expires_in_seconds=expires_in_seconds)
+    jobs = server.load_jobs()
+    server.enqueue_job(jobs, job)
+    server.save_jobs(jobs)
+    return job["id"]
+
+
+def run_to_completion(job_id, batch_size=2, cache=None):
+    cache = {} if cache is None else cache
+    for _ in range(100):
+        if server.run_job_batch(job_id, batch_size, cache):
+            return
+    raise AssertionError("job did not finish")
+
+
+def credits():
+    return {usuario: user["credits"] for usuario, user in server.load_users().items()}
+
+
+def test_grant_runs_in_batches_and_expires():
+    job_id = schedule(expires_in_seconds=60)
+    cache = {}
+    assert server.run_job_batch(job_id, 2, cache) is False
+    job = server.load_jobs()["jobs"][job_id]
+    assert (job["status"], job["processed"], job["total"], job["cursor"]) == ("running", 2, 5, "user1")
+    run_to_completion(job_id, cache=cache)
+    assert set(credits().values()) == {60}
+    assert cache == {}
+
+    jobs = server.load_jobs()
+    assert jobs["jobs"][job_id]["status"] == "done"
+    [(_, expire_id)] = jobs["queue"]
+    run_to_completion(expire_id)
+    assert set(credits().values()) == {10}
+    assert len(server.load_notifications()["user0"]) == 2
+    assert [e["amount"] for e in server.load_credit_events("user0")] == [50, -50]
+
+
+def test_batch_rerun_after_crash_is_idempotent(monkeypatch):
+    job_id = schedule()
+    original_save_jobs = server.save_jobs
+
+    def crash(jobs):
+        raise RuntimeError("killed")
+
+    # First batch dies after the users write but before the cursor is saved
+    monkeypatch.setattr(server, "save_jobs", crash)
+    with pytest.raises(RuntimeError):
+        server.run_job_batch(job_id, 2, {})
+    monkeypatch.setattr(server, "save_jobs", original_save_jobs)
+    assert credits()["user0"] == 60
+
+    # Restart: fresh targets cache, batch runs again from the old cursor
+    run_to_completion(job_id)
+    assert set(credits().values()) == {60}
+    assert len(server.load_notifications()["user0"]) == 1
+    assert len(server.load_credit_events("user0")) == 1
+    assert "applied_jobs" in server.load_users()["user0"]
+
+
+def test_crash_before_users_write_applies_once(monkeypatch):
+    job_id = schedule()
+    original_save_users = server.save_users
+
+    def crash(users):
+        raise RuntimeError("killed")
+
+    monkeypatch.setattr(server, "save_users", crash)
+    with pytest.raises(RuntimeError):
+        server.run_job_batch(job_id, 2, {})
+    monkeypatch.setattr(server, "save_users", original_save_users)
+    assert credits()["user0"] == 10
+
+    run_to_completion(job_id)
+    assert set(credits().values()) == {60}
+    assert len(server.load_notifications()["user0"]) == 1
+    assert len(server.load_credit_events("user0")) == 1
+    assert server.query_credit_history("user0", None, None, "day")[0]["events"] == 1
+
+
+def test_naive_and_malformed_created_at():
+    users = server.load_users()
+    users["user0"]["created_at"] = "2025-11-01T09:00:00"
+    users["user1"]["created_at"] = "not a date"
+    del users["user2"]["created_at"]
+    server.save_users(users)
+    job_id = schedule()
+    run_to_completion(job_id)
+    assert credits() == {"user0": 60, "user1": 10, "user2": 10, "user3": 60, "user4": 60}
+    assert server.load_jobs()["jobs"][job_id]["status"] == "done"
+
+
+def test_users_created_after_start_are_not_targeted():
+    job_id = schedule()
+    server.run_job_batch(job_id, 2, {})
+    users = server.load_users()
+    later = (datetime.now(timezone.utc) + timedelta(seconds=1)).isoformat()
+    users["user9"] = {"usuario": "user9", "credits": 0, "created_at": later}
+    server.save_users(users)
+    run_to_completion(job_id)
+    assert credits()["user9"] == 0
+
+
+def test_cancel_running_grant_keeps_expiry_for_granted_users():
+    job_id = schedule(expires_in_seconds=60)
+    server.run_job_batch(job_id, 2, {})
+
+    async def cancel():
+        server.app.dependency_overrides[server.get_admin_user] = lambda: {"usuario": "admin", "is_admin": True}
+        try:
+            async with AsyncClient(transport=ASGITransport(app=server.app), base_url="http://test") as client:
+                return await client.delete(f"/api/admin/jobs/{job_id}")
+        finally:
+            server.app.dependency_overrides.clear()
+
+    response = asyncio.run(cancel())
+    assert response.status_code == 200
+    assert response.json()["job"]["status"] == "cancelled"
+
+    jobs = server.load_jobs()
+    [(_, expire_id)] = jobs["queue"]
+    assert jobs["jobs"][expire_id]["until"] == "user1"
+    run_to_completion(expire_id)
+    assert set(credits().values()) == {10}
+    assert "user4" not in server.load_notifications()
+
+
+def test_first_run_skips_the_history_lookup(monkeypatch):
+    job_id = schedule()
+    lookups = []
+    original = server.credit_event_recorded
+    monkeypatch.setattr(server, "credit_event_recorded", lambda *args: lookups.append(args) or original(*args))
+    run_to_completion(job_id)
+    assert lookups == []
+    assert set(credits().values()) == {60}
+
+
+def test_failed_job_with_missing_record_is_dequeued():
+    jobs = server.load_jobs()
+    jobs["queue"] = [[datetime.now(timezone.utc).isoformat(), "missing"]]
+    server.save_jobs(jobs)
+    assert asyncio.run(server.JobScheduler(2)._run_due_batch()) == 0
+    assert server.load_jobs()["queue"] == []
+
+
+def test_scheduler_loop_survives_errors(monkeypatch):
+    monkeypatch.setattr(server, "SCHEDULER_ERROR_BACKOFF_SECONDS", 0.01)
+    job_id = schedule()
+    original_load_jobs = server.load_jobs
+    failures = []
+
+    def flaky_load_jobs():
+        if len(failures) < 2:
+            failures.append(1)
+            raise ValueError("corrupt jobs file")
+        return original_load_jobs()
+
+    monkeypatch.setattr(server, "load_jobs", flaky_load_jobs)
+
+    async def run():
+        job_scheduler = server.JobScheduler(2)
+        job_scheduler.start()
+        try:
+            for _ in range(200):
+                await asyncio.sleep(0.01)
+                if original_load_jobs()["jobs"][job_id]["status"] == "done":
+                    break
+        finally:
+            await job_scheduler.stop()
+
+    asyncio.run(run())
+    assert len(failures) == 2
+    assert original_load_jobs()["jobs"][job_id]["status"] == "done"
+    assert set(credits().values()) == {60}